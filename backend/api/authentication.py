@@ -0,0 +1,34 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+def get_cache_key(key):
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return f'auth_token:{digest}'
+
+
+def invalidate_token(key):
+    """Убирает токен из кеша после фиксации транзакции."""
+    transaction.on_commit(lambda: cache.delete(get_cache_key(key)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем токенов вместе с пользователями.
+
+    Запись живёт AUTH_TOKEN_CACHE_TIMEOUT секунд и удаляется раньше,
+    если токен удалён или пользователь изменён. В кеш попадает только
+    хеш токена.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        return token.user, token
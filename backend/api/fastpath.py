@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from recipes.models import Recipe, RecipeIngredient
+
+RECIPE_FIELDS = ('id', 'name', 'image', 'image_variants', 'text',
+                 'cooking_time', 'pub_date', 'favorites_count',
+                 'trending_score', 'author_id',
+                 'author__email', 'author__username', 'author__first_name',
+                 'author__last_name')
+
+
+def get_recipe_rows(queryset):
+    """Строки рецептов вместе с аннотациями запроса."""
+    return queryset.prefetch_related(None).values(
+        *RECIPE_FIELDS, *queryset.query.annotations)
+
+
+def build_url(request, name):
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def serialize_recipes(rows, context):
+    """Собирает ответ как у RecipeListSerializer, но без полей DRF."""
+    request = context.get('request')
+    subscriptions = context.get('subscriptions') or set()
+    recipe_ids = [row['id'] for row in rows]
+    tags = defaultdict(list)
+    for tag in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).order_by('tag_id').values(
+                'recipe_id', 'tag_id', 'tag__name', 'tag__color',
+                'tag__slug'):
+        tags[tag['recipe_id']].append({
+            'id': tag['tag_id'],
+            'name': tag['tag__name'],
+            'color': tag['tag__color'],
+            'slug': tag['tag__slug'],
+        })
+    ingredients = defaultdict(list)
+    for ingredient in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).order_by('id').values(
+                'recipe_id', 'ingredient_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'):
+        ingredients[ingredient['recipe_id']].append({
+            'id': ingredient['ingredient_id'],
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        })
+    return [{
+        'id': row['id'],
+        'tags': tags[row['id']],
+        'author': {
+            'email': row['author__email'],
+            'id': row['author_id'],
+            'username': row['author__username'],
+            'first_name': row['author__first_name'],
+            'last_name': row['author__last_name'],
+            'is_subscribed': row['author_id'] in subscriptions,
+        },
+        'ingredients': ingredients[row['id']],
+        'is_favorited': bool(row['is_favorited']),
+        'is_in_shopping_cart': bool(row['is_in_shopping_cart']),
+        'name': row['name'],
+        'image': build_url(request, row['image']) if row['image'] else None,
+        'image_variants': {
+            name: build_url(request, path)
+            for name, path in (row['image_variants'] or {}).items()
+        },
+        'text': row['text'],
+        'cooking_time': row['cooking_time'],
+    } for row in rows]
@@ -0,0 +1,36 @@
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64FieldMixin
+from PIL import Image
+from rest_framework import serializers
+
+
+class Base64ImageUploadField(Base64FieldMixin, serializers.FileField):
+    """Изображение в base64, в запросе проверяется только заголовок.
+
+    Полное декодирование, удаление EXIF и уменьшенные копии делает
+    фоновая задача recipes.images.process_recipe_image.
+    """
+    ALLOWED_TYPES = ('jpeg', 'png', 'gif', 'webp')
+    INVALID_FILE_MESSAGE = 'Загрузите корректное изображение.'
+    INVALID_TYPE_MESSAGE = 'Не удалось определить формат изображения.'
+
+    def get_file_extension(self, filename, decoded_file):
+        try:
+            image_format = Image.open(BytesIO(decoded_file)).format
+        except (OSError, ValueError):
+            return None
+        return (image_format or '').lower()
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for name, path in (variants or {}).items():
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
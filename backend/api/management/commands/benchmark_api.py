@@ -0,0 +1,92 @@
+import random
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def fetch(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Замер задержки и числа запросов к БД для основных эндпоинтов '
+            'через тестовый клиент Django')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Число запросов на эндпоинт')
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def get_endpoints(self, limit):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        names = list(Ingredient.objects.values_list('name', flat=True)[:500])
+        if not recipe_ids or not slugs or not names:
+            raise CommandError(
+                'Недостаточно данных: выполните importcsv и generate_data')
+        return {
+            'Список рецептов': lambda: f'/api/recipes/?limit={limit}',
+            'Список рецептов по тегам': lambda: (
+                f'/api/recipes/?limit={limit}&tags={random.choice(slugs)}'
+                f'&tags={random.choice(slugs)}'),
+            'Избранное': lambda: (
+                f'/api/recipes/?limit={limit}&is_favorited=1'),
+            'Популярные, курсор': lambda: (
+                f'/api/recipes/?limit={limit}&ordering=popular&cursor='),
+            'Рецепт': lambda: f'/api/recipes/{random.choice(recipe_ids)}/',
+            'Лента подписок': lambda: f'/api/recipes/feed/?limit={limit}',
+            'Подписки': lambda: (
+                f'/api/users/subscriptions/?limit={limit}&recipes_limit=3'),
+            'Список покупок': lambda: '/api/recipes/download_shopping_cart/',
+            'Поиск ингредиента': lambda: (
+                f'/api/ingredients/?name={random.choice(names)[:2]}'),
+        }
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        user = User.objects.order_by('-followers_count').filter(
+            follower__isnull=False, shopping_cart__isnull=False).first()
+        if user is None:
+            raise CommandError('Нет пользователя с подписками и покупками: '
+                               'выполните generate_data')
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.stdout.write(
+            f'{connection.vendor}, пользователь {user.username}\n'
+            f'{"эндпоинт":<28}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"макс, мс":>10}{"запросов":>10}')
+        for name, get_url in self.get_endpoints(options['limit']).items():
+            fetch(client, get_url())
+            timings = []
+            queries = []
+            for _ in range(options['requests']):
+                url = get_url()
+                with CaptureQueriesContext(connection) as context:
+                    started = perf_counter()
+                    response = fetch(client, url)
+                    timings.append((perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{url}: ответ {response.status_code}')
+                queries.append(len(context))
+            self.stdout.write(
+                f'{name:<28}{median(timings):>10.1f}'
+                f'{percentile(timings, 0.95):>10.1f}{max(timings):>10.1f}'
+                f'{sum(queries) / len(queries):>10.1f}')
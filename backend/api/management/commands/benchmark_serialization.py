@@ -0,0 +1,49 @@
+from timeit import timeit
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.test import APIRequestFactory
+
+from api.fastpath import get_recipe_rows, serialize_recipes
+from api.serializers import RecipeListSerializer
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = 'Сравнение стоимости сериализации рецептов: DRF и быстрый путь'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = AnonymousUser()
+        context = {'request': request}
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        ).annotate_user_flags(request.user)[:options['recipes']]
+        recipes = list(queryset)
+        rows = list(get_recipe_rows(queryset))
+        if not recipes:
+            self.stdout.write(self.style.ERROR('В базе нет рецептов.'))
+            return
+        repeat = options['repeat']
+        total = len(recipes) * repeat
+        drf = timeit(
+            lambda: RecipeListSerializer(
+                recipes, many=True, context=context).data,
+            number=repeat
+        )
+        fast = timeit(lambda: serialize_recipes(rows, context),
+                      number=repeat)
+        self.stdout.write(
+            f'Рецептов: {len(recipes)}, повторов: {repeat}\n'
+            f'DRF: {drf / total * 1e6:.1f} мкс на рецепт\n'
+            f'Быстрый путь (с запросами тегов и ингредиентов): '
+            f'{fast / total * 1e6:.1f} мкс на рецепт'
+        )
@@ -0,0 +1,199 @@
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'buckets': dict(zip(bounds, self.counts)),
+            'count': self.total,
+            'sum': round(self.sum, 3),
+            'max': round(self.max, 3),
+        }
+
+
+class MetricsRegistry:
+    """Гистограммы метрик по эндпоинтам в памяти процесса."""
+    metrics = (('total_ms', LATENCY_BUCKETS), ('db_ms', LATENCY_BUCKETS),
+               ('view_ms', LATENCY_BUCKETS),
+               ('serialize_ms', LATENCY_BUCKETS),
+               ('render_ms', LATENCY_BUCKETS), ('queries', QUERY_BUCKETS))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def observe(self, endpoint, values):
+        with self.lock:
+            histograms = self.endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self.endpoints[endpoint] = {
+                    name: Histogram(buckets)
+                    for name, buckets in self.metrics
+                }
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                endpoint: {name: histogram.as_dict()
+                           for name, histogram in histograms.items()}
+                for endpoint, histograms in sorted(self.endpoints.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+registry = MetricsRegistry()
+
+
+class QueryTracker:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self.queries.append((elapsed, sql))
+
+
+@contextmanager
+def measure_serialization(request):
+    """Засекает сборку данных ответа для метрики serialize_ms.
+
+    Время запросов к БД внутри блока в неё не входит, оно уже есть
+    в db_ms.
+    """
+    request = getattr(request, '_request', request)
+    tracker = getattr(request, '_metrics_tracker', None)
+    if tracker is None:
+        yield
+        return
+    started = perf_counter()
+    db_started = tracker.duration
+    try:
+        yield
+    finally:
+        request._metrics_serialize += (
+            perf_counter() - started - (tracker.duration - db_started))
+
+
+def get_endpoint_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        match = request.resolver_match
+        return match.view_name if match else view_func.__name__
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """Число запросов к БД и время обработки по эндпоинтам.
+
+    Включается настройкой API_METRICS_ENABLED. Отдаёт заголовок
+    Server-Timing и копит гистограммы для /api/metrics/, а медленные
+    запросы пишет в лог вместе с SQL.
+
+    view_ms — работа представления без сериализации, serialize_ms —
+    сборка данных ответа в блоках measure_serialization, render_ms —
+    кодирование ответа рендерером.
+    """
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        request._metrics_endpoint = None
+        request._metrics_view_done = None
+        tracker = QueryTracker()
+        request._metrics_tracker = tracker
+        request._metrics_serialize = 0.0
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            response = self.get_response(request)
+        finished = perf_counter()
+        endpoint = request._metrics_endpoint
+        if endpoint is None:
+            return response
+        view_done = request._metrics_view_done or finished
+        serialize = request._metrics_serialize
+        values = {
+            'total_ms': (finished - started) * 1000,
+            'db_ms': tracker.duration * 1000,
+            'view_ms': (view_done - started - serialize) * 1000,
+            'serialize_ms': serialize * 1000,
+            'render_ms': (finished - view_done) * 1000,
+            'queries': tracker.count,
+        }
+        registry.observe(endpoint, values)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={values["db_ms"]:.1f};desc="{tracker.count} queries"',
+            f'view;dur={values["view_ms"]:.1f}',
+            f'serialize;dur={values["serialize_ms"]:.1f}',
+            f'render;dur={values["render_ms"]:.1f}',
+            f'total;dur={values["total_ms"]:.1f}',
+        ))
+        self.log_slow_request(endpoint, values, tracker)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_endpoint = get_endpoint_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        request._metrics_view_done = perf_counter()
+        return response
+
+    def log_slow_request(self, endpoint, values, tracker):
+        if (values['total_ms'] < settings.API_METRICS_SLOW_MS
+                and tracker.count <= settings.API_METRICS_MAX_QUERIES):
+            return
+        queries = '\n'.join(
+            f'{elapsed * 1000:.1f} мс: {sql}'
+            for elapsed, sql in tracker.queries
+        )
+        logger.warning(
+            '%s: %.1f мс, запросов к БД %d (%.1f мс)\n%s',
+            endpoint, values['total_ms'], tracker.count, values['db_ms'],
+            queries
+        )
@@ -0,0 +1,49 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.cache import get_data_version
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class ReferenceCacheMixin:
+    """Кеширует ответы справочников до следующего изменения данных.
+
+    Ключ кеша и ETag зависят от версии данных модели, которую сигналы
+    меняют при сохранении и удалении объектов.
+    """
+
+    def get_cached_response(self, request, get_data):
+        model = self.queryset.model
+        version = get_data_version(model)
+        digest = md5(
+            f'{version}:{request.get_full_path()}'.encode()).hexdigest()
+        etag = f'"{digest}"'
+        last_modified = version // 1000
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        key = f'response:{model._meta.label_lower}:{digest}'
+        data = cache.get(key)
+        if data is None:
+            data = get_data()
+            cache.set(key, data, CACHE_TIMEOUT)
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        view = super().list
+        return self.get_cached_response(
+            request, lambda: view(request, *args, **kwargs).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        view = super().retrieve
+        return self.get_cached_response(
+            request, lambda: view(request, *args, **kwargs).data)
@@ -1,6 +1,237 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+from datetime import datetime
+from itertools import chain
+from operator import itemgetter
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from recipes.feed import FEED_ORDERING
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from .filters import RECIPE_ORDERINGS, SEARCH_ORDERING
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                 for field in ordering)
+
+
+def get_keyset_filter(ordering, values):
+    """Строки, идущие в порядке ordering строго после values.
+
+    a < x OR (a = x AND (b < y OR (b = y AND c < z))), плюс условие
+    a <= x, по которому PostgreSQL начинает просмотр индекса.
+    """
+    condition = None
+    for field in reversed(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        after = Q(**{f'{name}__{lookup}': values[name]})
+        if condition is not None:
+            after |= Q(**{name: values[name]}) & condition
+        condition = after
+    first = ordering[0]
+    name = first.lstrip('-')
+    lookup = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{name}__{lookup}': values[name]}) & condition
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL без COUNT(*)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
 
 
 class MyPagination(PageNumberPagination):
     page_size_query_param = "limit"
     page_size = 6
+
+
+class BaseCursorPagination(CursorPagination):
+    page_size_query_param = "limit"
+    page_size = 6
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.set_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def set_count(self, queryset, request):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approximate':
+            self.count = estimate_count(queryset)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = OrderedDict(
+                [('count', self.count), *response.data.items()])
+        return response
+
+
+class KeysetPagination(BaseCursorPagination):
+    """Курсорная пагинация по значениям всех полей сортировки.
+
+    CursorPagination из DRF запоминает только первое поле, а при
+    одинаковых значениях добавляет смещение, которое ограничено
+    offset_cutoff: на сортировке с тысячами равных счётчиков страницы
+    начинают повторяться. Здесь курсор хранит значения всех полей,
+    последнее из которых уникально (id), а страница выбирается
+    условием по ним без OFFSET.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.set_count(queryset, request)
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        self.position = self.decode_position(self.cursor)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = (reverse_ordering(self.ordering) if reverse
+                    else self.ordering)
+        results = self.get_rows(queryset, ordering)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+        return self.page
+
+    def get_rows(self, queryset, ordering):
+        """Строки после курсора, на одну больше размера страницы."""
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(
+                    get_keyset_filter(ordering, self.position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+    def decode_position(self, cursor):
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        fields = {field.lstrip('-') for field in self.ordering}
+        if not isinstance(position, dict) or set(position) != fields:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_position(self, row):
+        position = {}
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = row[name] if isinstance(row, dict) else getattr(row, name)
+            # DjangoJSONEncoder отбрасывает микросекунды, а курсору нужно
+            # точное значение.
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position[name] = value
+        return json.dumps(position)
+
+    def get_link(self, row, reverse):
+        if row is None:
+            position = (None if self.position is None
+                        else json.dumps(self.position))
+        else:
+            position = self.get_position(row)
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.get_link(self.page[-1] if self.page else None, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.get_link(self.page[0] if self.page else None, True)
+
+
+class RecipeCursorPagination(KeysetPagination):
+    ordering = RECIPE_ORDERINGS['recent']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering')
+        if ordering not in RECIPE_ORDERINGS and (
+                'search_rank' in queryset.query.annotations):
+            return SEARCH_ORDERING
+        return RECIPE_ORDERINGS.get(ordering, self.ordering)
+
+
+class FeedPagination(KeysetPagination):
+    """Лента подписок из нескольких источников (см. get_feed).
+
+    Из каждого источника берётся страница по его индексу, страницы
+    сливаются в порядке FEED_ORDERING.
+    """
+    ordering = FEED_ORDERING
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+    def set_count(self, sources, request):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approximate':
+            self.count = sum(estimate_count(source) for source in sources)
+
+    def get_rows(self, sources, ordering):
+        get_rows = super().get_rows
+        rows = chain.from_iterable(
+            get_rows(source, ordering) for source in sources)
+        return sorted(
+            rows, key=itemgetter('pub_date', 'recipe_id'),
+            reverse=ordering == self.ordering
+        )[:self.page_size + 1]
+
+
+class SubscriptionCursorPagination(BaseCursorPagination):
+    ordering = ('id',)
+
+
+class CursorOptionalPagination(MyPagination):
+    """Постраничная пагинация с переходом на курсорную по ?cursor=.
+
+    Первая страница в курсорном режиме запрашивается с пустым cursor,
+    дальше клиент идёт по ссылкам next и previous.
+    """
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_pagination_class.cursor_query_param in (
+                request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class SubscriptionPagination(CursorOptionalPagination):
+    cursor_pagination_class = SubscriptionCursorPagination
@@ -0,0 +1,72 @@
+import csv
+import json
+from datetime import date
+
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Псевдо-буфер: csv.writer сразу получает готовую строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок, отдающий его по частям."""
+    charset = 'utf-8'
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+    def render_errors(self, data):
+        return '\n'.join(str(value) for value in data.values())
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return self.render_errors(data).encode(self.charset)
+        return ''.join(self.stream(data)).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        today = date.today().strftime("%d-%m-%Y")
+        yield f'Список покупок на: {today}\n\n'
+        for ingredient in rows:
+            yield (
+                f'{ingredient["name"]} '
+                f'({ingredient["measurement_unit"]}) — '
+                f'{ingredient["amount"]}\n'
+            )
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Единица измерения',
+                               'Количество'))
+        for ingredient in rows:
+            yield writer.writerow((ingredient['name'],
+                                   ingredient['measurement_unit'],
+                                   ingredient['amount']))
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render_errors(self, data):
+        return json.dumps(data, ensure_ascii=False)
+
+    def stream(self, rows):
+        separator = '['
+        for ingredient in rows:
+            yield separator + json.dumps(ingredient, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
@@ -1,13 +1,17 @@
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 
 
+from recipes.cookable import update_cookable_index
+from recipes.images import process_recipe_image, reset_image_variants
 from recipes.models import (Favorite, Follow, Ingredient, Recipe,
                             RecipeIngredient, ShoppingCart, Tag)
+from recipes.search import update_search_vectors
+from recipes.tasks import enqueue
 from users.models import User
+from .fields import Base64ImageUploadField, ImageVariantsField
 
 
 class GetUserSerializer(serializers.ModelSerializer):
@@ -22,53 +26,53 @@ class GetUserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        if user.is_anonymous:
+            return False
+        subscriptions = self.context.get('subscriptions')
+        if subscriptions is not None:
+            return obj.id in subscriptions
+        return Follow.objects.filter(user=user, author=obj).exists()
 
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
-class FollowSerializer(serializers.ModelSerializer):
-    email = serializers.ReadOnlyField(source='author.email')
-    id = serializers.ReadOnlyField(source='author.id')
-    username = serializers.ReadOnlyField(source='author.username')
-    first_name = serializers.ReadOnlyField(source='author.first_name')
-    last_name = serializers.ReadOnlyField(source='author.last_name')
-    is_subscribed = serializers.SerializerMethodField()
+class SubscriptionSerializer(GetUserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
-    class Meta:
-        model = Follow
+    class Meta(GetUserSerializer.Meta):
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
-    def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(
-                user=obj.user,
-                author=obj.author).exists()
-        return False
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj, 'newest_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author=obj)
+            if limit and limit.isdigit():
+                recipes = recipes[:int(limit)]
         return RecipeMiniSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+
+class FollowSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Follow
+        fields = ('user', 'author')
+        read_only_fields = ('user', 'author')
+
+    def to_representation(self, instance):
+        return SubscriptionSerializer(
+            instance.author, context=self.context).data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -104,33 +108,19 @@ class RecipeListSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredients'
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
-
-    def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Favorite.objects.filter(author=user, recipe=obj).exists()
-        return False
-
-    def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return ShoppingCart.objects.filter(author=user,
-                                               recipe=obj).exists()
-        return False
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -177,13 +167,34 @@ class ShoppingCartSerializer(BaseRecipeSerializer):
         ]
 
 
+class CookableSerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+    max_missing = serializers.IntegerField(
+        min_value=0,
+        max_value=10,
+        default=2
+    )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = AddIngredientSerializer(many=True, write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True
     )
-    image = Base64ImageField()
+    image = Base64ImageUploadField()
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault())
 
@@ -196,36 +207,48 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if not value:
             raise ValidationError(
                 {'ingredients': 'Необходимо выбрать ингредиент'})
-        ingredients_list = []
+        ingredients = Ingredient.objects.in_bulk(
+            [item['id'] for item in value])
+        errors = []
+        seen = set()
         for item in value:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингридиенты не должны повторяться'})
+            item_errors = {}
+            if item['id'] not in ingredients:
+                item_errors['id'] = ['Ингредиент не найден']
+            elif item['id'] in seen:
+                item_errors['id'] = ['Ингридиенты не должны повторяться']
             if int(item['amount']) <= 0:
-                raise ValidationError(
-                    {'amount': 'Количество должно быть больше 0!'})
-            ingredients_list.append(ingredient)
+                item_errors['amount'] = ['Количество должно быть больше 0!']
+            seen.add(item['id'])
+            errors.append(item_errors)
+        if any(errors):
+            raise ValidationError(errors)
+        for item in value:
+            item['id'] = ingredients[item['id']]
         return value
 
     def validate_tags(self, value):
         if not value:
             raise ValidationError(
                 {'tags': 'Необходимо выбрать тег'})
-        tags_list = []
-        for tag in value:
-            if tag in tags_list:
-                raise ValidationError(
-                    {'tags': 'Теги не должны повторяться'})
-            tags_list.append(tag)
-        return value
+        tags = Tag.objects.in_bulk(value)
+        errors = []
+        missing = [str(pk) for pk in value if pk not in tags]
+        if missing:
+            errors.append(f'Теги не найдены: {", ".join(missing)}')
+        if len(set(value)) != len(value):
+            errors.append('Теги не должны повторяться')
+        if errors:
+            raise ValidationError(errors)
+        return [tags[pk] for pk in value]
 
     def to_representation(self, instance):
         recipe = super().to_representation(instance)
         recipe['ingredients'] = RecipeIngredientSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredient'),
+            many=True).data
         recipe['tags'] = TagSerializer(
-            instance.tags.all(), many=True).data
+            instance.tags.order_by('id'), many=True).data
         return recipe
 
     def add_tags_ingredients(self, ingredients, tags, model):
@@ -238,16 +261,55 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
         model.tags.set(tags)
 
+    def update_ingredients(self, instance, ingredients):
+        """Применяет к рецепту только отличия в составе ингредиентов."""
+        amounts = {item['id'].id: item['amount'] for item in ingredients}
+        current = {recipe_ingredient.ingredient_id: recipe_ingredient
+                   for recipe_ingredient in instance.recipe_ingredients.all()}
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        removed = [recipe_ingredient.id
+                   for ingredient_id, recipe_ingredient in current.items()
+                   if ingredient_id not in amounts]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=instance,
+                             ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = super().create(validated_data)
         self.add_tags_ingredients(ingredients, tags, recipe)
+        update_search_vectors([recipe.id])
+        update_cookable_index([recipe.id])
+        enqueue(process_recipe_image, recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.add_tags_ingredients(ingredients, tags, instance)
-        return super().update(instance, validated_data)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            reset_image_variants(instance)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+            update_cookable_index([instance.id])
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None or {'name', 'text'} & set(validated_data):
+            update_search_vectors([instance.id])
+        return instance
@@ -1,49 +1,95 @@
-from datetime import date
+from hashlib import md5
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Value, prefetch_related_objects)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from recipes.models import (Favorite, Follow, Ingredient, Recipe,
                             RecipeIngredient, ShoppingCart, Tag)
+from recipes.cache import get_data_version
+from recipes.cookable import cookable_index
+from recipes.feed import get_feed
+from recipes.items import add_items, lock_user, remove_items
+from recipes.search import ingredient_index
+from recipes.shopping_list import get_shopping_list
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .paginations import MyPagination
+from .fastpath import get_recipe_rows, serialize_recipes
+from .filters import RecipeFilter
+from .metrics import measure_serialization, registry
+from .mixins import CACHE_TIMEOUT, ReferenceCacheMixin
+from .paginations import (CursorOptionalPagination, FeedPagination,
+                          MyPagination, SubscriptionPagination)
 from .permissions import (IsAuthorOrAdminOrReadOnly,
                           IsCurrentUserOrAdminOrReadOnly)
-from .serializers import (FavoriteSerializer, FollowSerializer,
-                          GetUserSerializer, IngredientSerializer,
+from .renderers import (CSVShoppingListRenderer, JSONShoppingListRenderer,
+                        TextShoppingListRenderer)
+from .serializers import (CookableSerializer, FavoriteSerializer,
+                          FollowSerializer, GetUserSerializer,
+                          IngredientSerializer, RecipeIdsSerializer,
                           RecipeListSerializer, RecipeWriteSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          ShoppingCartSerializer, SubscriptionSerializer,
+                          TagSerializer)
 from users.models import User
 
 
-def get_shopping_list_data(author):
-    return RecipeIngredient.objects.filter(
-        recipe__shopping_cart__author=author
-    ).values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(
-        amounts=Sum('amount', distinct=True)
-    ).order_by('amounts')
-
-
-def generate_shopping_list_response(data):
-    today = date.today().strftime("%d-%m-%Y")
-    shopping_list = f'Список покупок на: {today}\n\n'
-    for ingredient in data:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]}) — '
-            f'{ingredient["amounts"]}\n'
-        )
-    return HttpResponse(shopping_list,
-                        content_type='text/plain; charset=utf-8')
+DETAIL_STATE_FIELDS = ('updated', 'author_id', 'author__email',
+                       'author__username', 'author__first_name',
+                       'author__last_name')
+
+CONSTRAINT_MESSAGES = {
+    'no_self_following': 'Нельзя подписаться на себя',
+    'unique_following': 'Подписка уже существует',
+    'unique_favorite': 'Рецепт уже в избранном',
+    'unique_cart': 'Рецепт уже в списке покупок',
+}
+
+
+def get_constraint_message(error, default):
+    """Текст ошибки по имени нарушенного ограничения в сообщении БД."""
+    text = str(error)
+    for name, message in CONSTRAINT_MESSAGES.items():
+        if name in text:
+            return message
+    return default
+
+
+def delete_locked(queryset):
+    """Удаляет объекты, предварительно заблокировав их строки.
+
+    QuerySet.delete() отправляет post_delete для всех найденных объектов,
+    даже если строку уже удалил параллельный запрос, и счётчики
+    уменьшались дважды. С блокировкой второй запрос дождётся первого
+    и ничего не найдёт.
+    """
+    with transaction.atomic():
+        objects = list(queryset.select_for_update())
+        for obj in objects:
+            obj.delete()
+    return len(objects)
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(registry.snapshot())
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -72,146 +118,312 @@ class UserViewSet(viewsets.ModelViewSet):
         if serializer.is_valid(raise_exception=True):
             user = self.request.user
             user.set_password(serializer.validated_data['new_password'])
-            user.save()
+            user.save(update_fields=['password'])
             return Response({'message': 'Пароль успешно изменен'},
                             status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    @action(detail=False,
+            permission_classes=[IsAuthenticated],
+            pagination_class=SubscriptionPagination)
     def subscriptions(self, request):
-        follows = Follow.objects.filter(user=self.request.user)
-        pages = self.paginate_queryset(follows)
-        serializer = FollowSerializer(
+        authors = User.objects.filter(following__user=self.request.user)
+        pages = self.paginate_queryset(authors)
+        recipes = Recipe.objects.filter(author__in=pages)
+        limit = request.GET.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.newest_per_author(int(limit))
+        prefetch_related_objects(
+            pages,
+            Prefetch('recipe', queryset=recipes, to_attr='newest_recipes')
+        )
+        serializer = SubscriptionSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context={'request': request,
+                     'subscriptions': {author.id for author in pages}}
         )
-        return self.get_paginated_response(serializer.data)
+        with measure_serialization(request):
+            data = serializer.data
+        return self.get_paginated_response(data)
 
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, pk):
-        author = get_object_or_404(User, id=self.kwargs.get('pk'))
         user = self.request.user
         if request.method == 'POST':
+            author = get_object_or_404(User, id=self.kwargs.get('pk'))
+            try:
+                with transaction.atomic():
+                    follow = Follow.objects.create(author=author, user=user)
+            except IntegrityError as error:
+                return Response(
+                    {'errors': get_constraint_message(
+                        error, 'Подписка уже существует')},
+                    status=status.HTTP_400_BAD_REQUEST)
             serializer = FollowSerializer(
-                data=request.data,
-                context={'request': request, 'author': author})
-            subscription = Follow.objects.filter(author=author, user=user)
-            if author == user:
-                return Response({'errors': 'Нельзя подписаться на себя'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            if subscription.exists():
-                return Response({'errors': 'Подписка уже существует'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=author, user=user)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Объект не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        if Follow.objects.filter(author=author, user=user).exists():
-            Follow.objects.get(author=author, user=user).delete()
+                follow, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        deleted = delete_locked(Follow.objects.filter(
+            author_id=self.kwargs.get('pk'), user=user))
+        if deleted:
             return Response({'message': 'Успешная отписка'},
                             status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=self.kwargs.get('pk'))
         return Response({'errors': 'Вы не подписаны на данного пользователя'},
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return self.get_cached_response(
+                request, lambda: ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = MyPagination
+    pagination_class = CursorOptionalPagination
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_base_queryset(self):
+        return Recipe.objects.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch('recipe_ingredients',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        )
+
+    def get_queryset(self):
+        return self.get_base_queryset().annotate_user_flags(
+            self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        if self.request.method in SAFE_METHODS and user.is_authenticated:
+            context['subscriptions'] = set(
+                user.follower.values_list('author_id', flat=True))
+        return context
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
         return RecipeWriteSerializer
 
-    @action(detail=True,
-            methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
-    def favorite(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
+    def serialize_list(self, rows):
+        with measure_serialization(self.request):
+            if settings.RECIPE_FAST_READ:
+                return serialize_recipes(rows, self.get_serializer_context())
+            return self.get_serializer(rows, many=True).data
+
+    def get_list_response(self, queryset):
+        if settings.RECIPE_FAST_READ:
+            queryset = get_recipe_rows(queryset)
+        return self.get_paginated_response(
+            self.serialize_list(self.paginate_queryset(queryset)))
+
+    def list(self, request, *args, **kwargs):
+        return self.get_list_response(
+            self.filter_queryset(self.get_queryset()))
+
+    def get_detail_state(self, pk):
+        """Версия рецепта и флаги пользователя одним запросом."""
         user = self.request.user
-        if request.method == 'POST':
-            if Favorite.objects.filter(author=user,
-                                       recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже в избранном'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = FavoriteSerializer(data={
-                'recipe': recipe.id,
-                'author': user.id
+        queryset = Recipe.objects.filter(pk=pk).annotate_user_flags(user)
+        if user.is_authenticated:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')))
+        else:
+            is_subscribed = Value(False, output_field=BooleanField())
+        return queryset.annotate(is_subscribed=is_subscribed).values(
+            *DETAIL_STATE_FIELDS, 'is_favorited', 'is_in_shopping_cart',
+            'is_subscribed').first()
+
+    def get_base_representation(self, pk):
+        """Рецепт так, как его видит анонимный пользователь."""
+        queryset = self.get_base_queryset().filter(
+            pk=pk).annotate_user_flags(AnonymousUser())
+        context = {**super().get_serializer_context(), 'subscriptions': set()}
+        if settings.RECIPE_FAST_READ:
+            return serialize_recipes(list(get_recipe_rows(queryset)),
+                                     context)[0]
+        return RecipeListSerializer(queryset.get(), context=context).data
+
+    def retrieve(self, request, *args, **kwargs):
+        """Рецепт с ETag и кешем общей для всех части ответа.
+
+        Общая часть хранится в кеше, пока не изменятся сам рецепт, его
+        автор, теги или ингредиенты. Флаги пользователя добавляются
+        поверх неё и учитываются в ETag.
+        """
+        try:
+            pk = int(self.kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        state = self.get_detail_state(pk)
+        if state is None:
+            raise Http404
+        version = ':'.join(str(value) for value in (
+            request.build_absolute_uri('/'), get_data_version(Tag),
+            get_data_version(Ingredient),
+            *(state[field] for field in DETAIL_STATE_FIELDS)
+        ))
+        digest = md5(version.encode()).hexdigest()
+        is_favorited, is_in_shopping_cart, is_subscribed = flags = tuple(
+            bool(state[field]) for field in (
+                'is_favorited', 'is_in_shopping_cart', 'is_subscribed'))
+        etag = '"{}"'.format(md5(f'{digest}:{flags}'.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = f'recipe_detail:{pk}:{digest}'
+            data = cache.get(key)
+            if data is None:
+                with measure_serialization(request):
+                    data = self.get_base_representation(pk)
+                cache.set(key, data, CACHE_TIMEOUT)
+            response = Response({
+                **data,
+                'author': {**data['author'], 'is_subscribed': is_subscribed},
+                'is_favorited': is_favorited,
+                'is_in_shopping_cart': is_in_shopping_cart,
             })
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not Favorite.objects.filter(author=user,
-                                       recipe=recipe).exists():
+            response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    @action(detail=False,
+            permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Лента подписок.
+
+        Страница выбирается по записям ленты, рецепты для неё
+        загружаются отдельным запросом по id.
+        """
+        recipes = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(get_feed(
+            request.user, recipes if recipes.query.has_filters() else None))
+        queryset = self.get_queryset().in_order(
+            [row['recipe_id'] for row in page], 'feed_rank')
+        if settings.RECIPE_FAST_READ:
+            queryset = get_recipe_rows(queryset)
+        return self.get_paginated_response(
+            self.serialize_list(list(queryset)))
+
+    @action(detail=False, pagination_class=MyPagination)
+    def cookable(self, request):
+        serializer = CookableSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = cookable_index.search(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['max_missing'])
+        return self.get_list_response(self.filter_queryset(
+            self.get_queryset().in_order(recipe_ids, 'cookable_rank')))
+
+    def change_item(self, request, model, serializer_class, messages):
+        """Добавление и удаление без предварительных проверок.
+
+        Повторное добавление отсекает ограничение уникальности в БД,
+        поэтому одновременные запросы не приводят к ошибке 500. Строка
+        пользователя блокируется, как в пакетных add_items и remove_items.
+        """
+        user = request.user
+        if request.method == 'POST':
+            recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
+            try:
+                with transaction.atomic():
+                    lock_user(user)
+                    item = model.objects.create(author=user, recipe=recipe)
+            except IntegrityError as error:
+                return Response(
+                    {'errors': get_constraint_message(error, messages[0])},
+                    status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer_class(item).data,
+                            status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            lock_user(user)
+            deleted = delete_locked(model.objects.filter(
+                author=user, recipe_id=self.kwargs.get('pk')))
+        if not deleted:
             return Response({'errors': 'Объект не найден'},
                             status=status.HTTP_404_NOT_FOUND)
-        get_object_or_404(Favorite, author=user, recipe=recipe).delete()
-        return Response({'message': 'Рецепт удалён из избранного'},
+        return Response({'message': messages[1]},
                         status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def favorite(self, request, *args, **kwargs):
+        return self.change_item(
+            request, Favorite, FavoriteSerializer,
+            ('Рецепт уже в избранном', 'Рецепт удалён из избранного'))
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
-        if request.method == 'POST':
-            if ShoppingCart.objects.filter(author=user,
-                                           recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже в списке покупок'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = ShoppingCartSerializer(data={
-                'recipe': recipe.id,
-                'author': user.id
-            })
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not ShoppingCart.objects.filter(author=user,
-                                           recipe=recipe).exists():
-            return Response({'errors': 'Объект не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        get_object_or_404(ShoppingCart, author=user, recipe=recipe).delete()
-        return Response({'message': 'Рецепт удалён из списка покупок'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.change_item(
+            request, ShoppingCart, ShoppingCartSerializer,
+            ('Рецепт уже в списке покупок', 'Рецепт удалён из списка покупок'))
+
+    def change_items(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        change = add_items if request.method == 'POST' else remove_items
+        statuses = change(model, request.user, recipe_ids)
+        return Response({'recipes': [
+            {'id': recipe_id, 'status': statuses[recipe_id]}
+            for recipe_id in recipe_ids
+        ]})
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='favorite/batch')
+    def favorite_batch(self, request):
+        return self.change_items(request, Favorite)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        return self.change_items(request, ShoppingCart)
 
     @action(detail=False,
             methods=['get'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[TextShoppingListRenderer,
+                              CSVShoppingListRenderer,
+                              JSONShoppingListRenderer])
     def download_shopping_cart(self, request):
-        author = get_object_or_404(User, id=self.request.user.pk)
-        if author.shopping_cart.exists():
-            data = get_shopping_list_data(author)
-            response = generate_shopping_list_response(data)
-            filename = 'shopping_list.txt'
-            response['Content-Disposition'] = (f'attachment; '
-                                               f'filename={filename}')
-            return response
-        return Response({'message': 'Список покупок пуст'},
-                        status=status.HTTP_404_NOT_FOUND)
+        items = get_shopping_list(self.request.user)
+        if not items:
+            return Response({'message': 'Список покупок пуст'},
+                            status=status.HTTP_404_NOT_FOUND)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(items),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        filename = f'shopping_list.{renderer.format}'
+        response['Content-Disposition'] = (f'attachment; '
+                                           f'filename={filename}')
+        return response
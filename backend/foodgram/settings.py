@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +97,18 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Сколько секунд процесс может не замечать новую версию данных справочников
+# и индексов в памяти, если она изменена в другом процессе.
+DATA_VERSION_CACHE_TIMEOUT = int(os.getenv('DATA_VERSION_CACHE_TIMEOUT', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -141,6 +154,26 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.User'
 
+TASKS_BACKEND = os.getenv('TASKS_BACKEND', 'recipes.tasks.ThreadPoolBackend')
+TASKS_WORKERS = int(os.getenv('TASKS_WORKERS', 2))
+
+RECIPE_FAST_READ = os.getenv('RECIPE_FAST_READ', 'True') == 'True'
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10000))
+FEED_BACKFILL = 50
+
+# LocMemCache у каждого процесса свой: выход из системы в одном воркере
+# не сбрасывает токен в остальных, поэтому без общего кеша (Memcached)
+# токен живёт в кеше недолго.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv(
+    'AUTH_TOKEN_CACHE_TIMEOUT',
+    10 if CACHES['default']['BACKEND'].endswith('LocMemCache') else 300
+))
+
+API_METRICS_ENABLED = os.getenv('API_METRICS_ENABLED', 'False') == 'True'
+API_METRICS_SLOW_MS = int(os.getenv('API_METRICS_SLOW_MS', 500))
+API_METRICS_MAX_QUERIES = int(os.getenv('API_METRICS_MAX_QUERIES', 30))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -151,6 +184,6 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
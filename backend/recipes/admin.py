@@ -1,7 +1,10 @@
 from django.contrib import admin
 
-from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+from .models import (Favorite, FeedItem, Follow, Ingredient, Recipe,
+                     RecipeIngredient, RecipeTrend, ShoppingCart, Tag)
+from .cookable import update_cookable_index
+from .images import reset_image_variants
+from .search import update_search_vectors
 
 
 class IngredientsInline(admin.TabularInline):
@@ -15,6 +18,11 @@ class FavoriteAdmin(admin.ModelAdmin):
     search_fields = ('author',)
 
 
+class FeedItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'recipe', 'pub_date')
+    list_filter = ('user',)
+
+
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('id', "user", "author")
     list_filter = ('author',)
@@ -35,7 +43,17 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientsInline]
 
     def in_favorite(self, obj):
-        return obj.favorite.all().count()
+        return obj.favorites_count
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            reset_image_variants(obj)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vectors([form.instance.id])
+        update_cookable_index([form.instance.id])
 
     in_favorite.short_description = 'В избранном'
 
@@ -46,6 +64,11 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class RecipeTrendAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'score', 'updated')
+    search_fields = ('recipe__name',)
+
+
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'recipe')
     list_filter = ('author',)
@@ -59,9 +82,11 @@ class TagAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Favorite, FavoriteAdmin)
+admin.site.register(FeedItem, FeedItemAdmin)
 admin.site.register(Follow, FollowAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
+admin.site.register(RecipeTrend, RecipeTrendAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
 admin.site.register(Tag, TagAdmin)
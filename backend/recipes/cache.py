@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import DataVersion
+
+
+def get_version_key(model):
+    return f'data_version:{model._meta.label_lower}'
+
+
+def get_timestamp():
+    return int(time.time() * 1000)
+
+
+def get_data_version(model):
+    """Версия данных модели: отметка времени последнего изменения в мс.
+
+    Читается из таблицы DataVersion и на DATA_VERSION_CACHE_TIMEOUT
+    секунд кешируется, так что изменение из другого процесса становится
+    видно не позже чем через это время.
+    """
+    key = get_version_key(model)
+    version = cache.get(key)
+    if version is None:
+        version = DataVersion.objects.get_or_create(
+            label=model._meta.label_lower,
+            defaults={'version': get_timestamp()}
+        )[0].version
+        cache.set(key, version, settings.DATA_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def bump_data_version(model):
+    """Меняет версию данных модели, возвращает прежнюю и новую версии."""
+    key = get_version_key(model)
+    with transaction.atomic():
+        data_version = DataVersion.objects.select_for_update().get_or_create(
+            label=model._meta.label_lower)[0]
+        previous = data_version.version
+        data_version.version = max(get_timestamp(), previous + 1)
+        data_version.save(update_fields=['version'])
+    # До фиксации транзакции новую версию видит только текущее соединение.
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+    return previous, data_version.version
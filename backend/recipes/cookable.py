@@ -0,0 +1,182 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .cache import bump_data_version
+from .models import RecipeIngredient
+from .search import VersionedIndex
+
+COOKABLE_LIMIT = 1000
+
+
+def set_bit(bitmap, position, value):
+    if value:
+        return bitmap | (1 << position)
+    return bitmap & ~(1 << position)
+
+
+def to_bitmap(positions):
+    if not positions:
+        return 0
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def add_sliced(slices, bitmap):
+    """Прибавляет 1 к счётчикам позиций, отмеченных в bitmap.
+
+    Счётчики хранятся поразрядно: slices[j] — j-й двоичный разряд
+    счётчика всех позиций сразу.
+    """
+    carry = bitmap
+    for digit, value in enumerate(slices):
+        if not carry:
+            break
+        slices[digit], carry = value ^ carry, value & carry
+    if carry:
+        slices.append(carry)
+
+
+def subtract_sliced(minuend, subtrahend):
+    """Поразрядная разность счётчиков, уменьшаемое не меньше вычитаемого."""
+    result = []
+    borrow = 0
+    for digit, value in enumerate(minuend):
+        other = subtrahend[digit] if digit < len(subtrahend) else 0
+        result.append(value ^ other ^ borrow)
+        borrow = (~value & (other | borrow)) | (other & borrow)
+    return result
+
+
+def equal_to(slices, number, mask):
+    """Позиции из mask, счётчик которых равен number."""
+    if number >> len(slices):
+        return 0
+    for digit, value in enumerate(slices):
+        mask &= value if number >> digit & 1 else ~value
+    return mask
+
+
+def iter_positions(bitmap):
+    """Номера установленных битов от старших к младшим."""
+    digits = bin(bitmap)[2:]
+    top = len(digits) - 1
+    index = digits.find('1')
+    while index != -1:
+        yield top - index
+        index = digits.find('1', index + 1)
+
+
+class CookableIndex(VersionedIndex):
+    """Какие рецепты можно приготовить из имеющихся ингредиентов.
+
+    Каждому рецепту назначается позиция, каждому ингредиенту — битовая
+    карта позиций рецептов, в которые он входит (целые числа Python).
+    Число совпавших ингредиентов считается для всех рецептов сразу
+    поразрядным сложением карт, без перебора строк RecipeIngredient.
+    """
+    model = RecipeIngredient
+
+    def _build(self):
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id').order_by().iterator():
+            recipes[recipe_id].append(ingredient_id)
+        recipe_ids = sorted(recipes)
+        positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(recipe_ids)
+        }
+        by_ingredient = defaultdict(list)
+        totals = defaultdict(list)
+        for recipe_id, ingredients in recipes.items():
+            position = positions[recipe_id]
+            for ingredient_id in ingredients:
+                by_ingredient[ingredient_id].append(position)
+            for digit in range(len(ingredients).bit_length()):
+                if len(ingredients) >> digit & 1:
+                    totals[digit].append(position)
+        return {
+            'recipe_ids': recipe_ids,
+            'positions': positions,
+            'ingredients': {recipe_id: tuple(ingredients)
+                            for recipe_id, ingredients in recipes.items()},
+            'bitmaps': {ingredient_id: to_bitmap(recipe_positions)
+                        for ingredient_id, recipe_positions
+                        in by_ingredient.items()},
+            'totals': [to_bitmap(totals[digit])
+                       for digit in range(len(totals))],
+        }
+
+    def _patch(self, data, recipe_ids):
+        """Обновляет карты только для изменившихся рецептов."""
+        current = defaultdict(tuple)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredient_id'):
+            current[recipe_id] += (ingredient_id,)
+        bitmaps = dict(data['bitmaps'])
+        totals = list(data['totals'])
+        for recipe_id in recipe_ids:
+            ingredients = current[recipe_id]
+            position = data['positions'].get(recipe_id)
+            if position is None:
+                if not ingredients:
+                    continue
+                position = data['positions'][recipe_id] = len(
+                    data['recipe_ids'])
+                data['recipe_ids'].append(recipe_id)
+            previous = data['ingredients'].pop(recipe_id, ())
+            for ingredient_id in set(previous) - set(ingredients):
+                bitmaps[ingredient_id] = set_bit(
+                    bitmaps[ingredient_id], position, False)
+            for ingredient_id in set(ingredients) - set(previous):
+                bitmaps[ingredient_id] = set_bit(
+                    bitmaps.get(ingredient_id, 0), position, True)
+            if ingredients:
+                data['ingredients'][recipe_id] = ingredients
+            while len(totals) < len(ingredients).bit_length():
+                totals.append(0)
+            for digit, value in enumerate(totals):
+                totals[digit] = set_bit(
+                    value, position, len(ingredients) >> digit & 1)
+        return {**data, 'bitmaps': bitmaps, 'totals': totals}
+
+    def refresh(self, recipe_ids):
+        previous, version = bump_data_version(self.model)
+        with self._lock:
+            if self._data is None or self._version != previous:
+                return
+            self._data = self._patch(self._data, recipe_ids)
+            self._version = version
+
+    def search(self, ingredient_ids, max_missing, limit=COOKABLE_LIMIT):
+        """id рецептов: сначала готовые целиком, затем по числу недостающих
+        ингредиентов, внутри группы — новые первыми."""
+        data = self._load()
+        matched = []
+        candidates = 0
+        for ingredient_id in set(ingredient_ids):
+            bitmap = data['bitmaps'].get(ingredient_id)
+            if bitmap:
+                add_sliced(matched, bitmap)
+                candidates |= bitmap
+        missing = subtract_sliced(data['totals'], matched)
+        recipe_ids = []
+        for number in range(max_missing + 1):
+            for position in iter_positions(
+                    equal_to(missing, number, candidates)):
+                recipe_ids.append(data['recipe_ids'][position])
+                if len(recipe_ids) == limit:
+                    return recipe_ids
+        return recipe_ids
+
+
+cookable_index = CookableIndex()
+
+
+def update_cookable_index(recipe_ids):
+    """Обновляет индекс после фиксации транзакции с изменениями рецептов."""
+    transaction.on_commit(lambda: cookable_index.refresh(recipe_ids))
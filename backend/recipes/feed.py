@@ -0,0 +1,112 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from users.models import User
+from .models import FeedItem, Follow, Recipe
+
+BATCH_SIZE = 1000
+FEED_ORDERING = ('-pub_date', '-recipe_id')
+
+
+def is_fanned_out(author_id):
+    """Рецепты автора раскладываются по лентам подписчиков при записи.
+
+    Для авторов с очень большим числом подписчиков лента собирается
+    при чтении.
+    """
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def get_follower_batches(author_id):
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator()
+    while True:
+        batch = list(islice(followers, BATCH_SIZE))
+        if not batch:
+            return
+        yield batch
+
+
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date').first()
+    if recipe is None or not is_fanned_out(recipe['author_id']):
+        return
+    for batch in get_follower_batches(recipe['author_id']):
+        FeedItem.objects.bulk_create(
+            (FeedItem(user_id=user_id, recipe_id=recipe_id,
+                      author_id=recipe['author_id'],
+                      pub_date=recipe['pub_date'])
+             for user_id in batch),
+            ignore_conflicts=True
+        )
+
+
+def get_backfill_recipes(author_id):
+    return list(Recipe.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')[:settings.FEED_BACKFILL])
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту последние рецепты нового автора в подписках."""
+    if not is_fanned_out(author_id):
+        return
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe_id,
+                  author_id=author_id, pub_date=pub_date)
+         for recipe_id, pub_date in get_backfill_recipes(author_id)),
+        ignore_conflicts=True
+    )
+
+
+def backfill_followers(author_id):
+    """Добавляет последние рецепты автора в ленты всех подписчиков.
+
+    Пока подписчиков было больше FEED_FANOUT_LIMIT, рецепты автора
+    в ленты не раскладывались, а брались при чтении.
+    """
+    if not is_fanned_out(author_id):
+        return
+    recipes = get_backfill_recipes(author_id)
+    for batch in get_follower_batches(author_id):
+        FeedItem.objects.bulk_create(
+            (FeedItem(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+             for user_id in batch for recipe_id, pub_date in recipes),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+
+def get_feed(user, recipes=None):
+    """Источники ленты пользователя: строки pub_date и recipe_id.
+
+    Записи из таблицы ленты читаются по индексу (user, -pub_date),
+    рецепты авторов, лента которых собирается при чтении, — из таблицы
+    рецептов. Пагинация берёт страницу из каждого источника в порядке
+    FEED_ORDERING и сливает их. recipes, если задан, оставляет в ленте
+    только рецепты из этого запроса.
+    """
+    popular_authors = list(user.follower.filter(
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('author_id', flat=True))
+    items = FeedItem.objects.filter(user=user)
+    if popular_authors:
+        # Записи, разложенные до того, как у автора стало слишком много
+        # подписчиков, уже есть во втором источнике.
+        items = items.exclude(author_id__in=popular_authors)
+    if recipes is not None:
+        items = items.filter(recipe__in=recipes.values('pk'))
+    sources = [items.values('pub_date', 'recipe_id')]
+    if popular_authors:
+        popular = Recipe.objects.filter(author_id__in=popular_authors)
+        if recipes is not None:
+            popular = popular.filter(pk__in=recipes.values('pk'))
+        sources.append(popular.values('pub_date', recipe_id=F('id')))
+    return sources
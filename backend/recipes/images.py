@@ -0,0 +1,97 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .tasks import enqueue
+
+ERROR_LENGTH = 255
+VARIANTS = {
+    'thumbnail': ((320, 320), 'JPEG'),
+    'thumbnail_webp': ((320, 320), 'WEBP'),
+    'medium_webp': ((960, 960), 'WEBP'),
+}
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png', 'GIF': 'gif'}
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=85, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def strip_metadata(path, image, image_format):
+    """Перезаписывает оригинал без EXIF, сохранив ориентацию."""
+    if image_format not in ('JPEG', 'PNG', 'WEBP'):
+        return
+    default_storage.delete(path)
+    default_storage.save(path, encode(image, image_format))
+
+
+def delete_variants(variants):
+    for path in variants.values():
+        default_storage.delete(path)
+
+
+def reset_image_variants(recipe):
+    """Сбрасывает копии прежнего изображения и ставит в очередь новые."""
+    variants = Recipe.objects.filter(pk=recipe.pk).values_list(
+        'image_variants', flat=True).first()
+    if variants:
+        enqueue(delete_variants, variants)
+    recipe.image_variants = {}
+    recipe.image_error = ''
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_variants={}, image_error='')
+    enqueue(process_recipe_image, recipe.pk)
+
+
+def process_recipe_image(recipe_id):
+    """Проверяет загруженное изображение рецепта и готовит его копии.
+
+    Текст ошибки сохраняется в image_error, рецепты без копий можно
+    обработать повторно командой process_images.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_variants').first()
+    if recipe is None or not recipe.image:
+        return
+    path = recipe.image.name
+    try:
+        updated = make_variants(recipe_id, path)
+    except Exception as error:
+        Recipe.objects.filter(pk=recipe_id, image=path).update(
+            image_error=f'{type(error).__name__}: {error}'[:ERROR_LENGTH])
+        raise
+    if updated:
+        delete_variants(recipe.image_variants)
+
+
+def make_variants(recipe_id, path):
+    """Сохраняет копии, если изображение рецепта за это время не сменилось."""
+    with default_storage.open(path, 'rb') as file:
+        image = Image.open(file)
+        image_format = image.format
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    strip_metadata(path, image, image_format)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = {}
+    for name, (size, variant_format) in VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail(size)
+        variants[name] = default_storage.save(
+            f'dishes/variants/{stem}_{name}.{EXTENSIONS[variant_format]}',
+            encode(variant, variant_format)
+        )
+    updated = Recipe.objects.filter(pk=recipe_id, image=path).update(
+        image_variants=variants, image_error='', updated=timezone.now())
+    if not updated:
+        delete_variants(variants)
+    return bool(updated)
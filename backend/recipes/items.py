@@ -0,0 +1,106 @@
+from django.db import connections, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import User
+
+from .models import Favorite, Recipe, ShoppingCart
+from .shopping_list import invalidate_shopping_list
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+NOT_FOUND = 'not_found'
+
+
+def change_counters(model, recipe_ids, delta):
+    """Один UPDATE счётчиков вместо сигналов на каждую запись."""
+    field = COUNTER_FIELDS[model]
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def recount_counters(model, recipe_ids):
+    """Пересчёт счётчиков по строкам, когда разница неизвестна."""
+    field = COUNTER_FIELDS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(**{field: Coalesce(
+        Subquery(model.objects.filter(recipe=OuterRef('pk')).order_by(
+        ).values('recipe').annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()),
+        0)})
+
+
+def lock_user(user):
+    """Изменения избранного и списка покупок одного пользователя, пачкой
+    и по одному рецепту, выполняются по очереди, иначе статусы и
+    счётчики считаются по одному и тому же снимку данных."""
+    User.objects.select_for_update().only('id').get(pk=user.pk)
+
+
+def delete_rows(model, pks):
+    """DELETE по первичным ключам без сигналов post_delete: счётчики
+    меняются одним UPDATE в change_counters, а QuerySet.delete()
+    отправил бы сигнал на каждую строку."""
+    if not pks:
+        return 0
+    connection = connections[model.objects.db]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {} WHERE {} IN ({})'.format(
+                quote(model._meta.db_table), quote(model._meta.pk.column),
+                ', '.join(['%s'] * len(pks))),
+            list(pks))
+        return cursor.rowcount
+
+
+@transaction.atomic
+def add_items(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или список покупок пачкой.
+
+    Возвращает статус для каждого переданного id.
+    """
+    lock_user(user)
+    found = set(Recipe.objects.filter(
+        pk__in=recipe_ids).values_list('id', flat=True))
+    existing = set(model.objects.filter(
+        author=user, recipe_id__in=found).values_list('recipe_id', flat=True))
+    new = found - existing
+    model.objects.bulk_create(
+        (model(author=user, recipe_id=recipe_id) for recipe_id in new),
+        ignore_conflicts=True
+    )
+    change_counters(model, new, 1)
+    if new and model is ShoppingCart:
+        invalidate_shopping_list(user.id)
+    return {
+        recipe_id: (ADDED if recipe_id in new
+                    else EXISTS if recipe_id in existing else NOT_FOUND)
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def remove_items(model, user, recipe_ids):
+    """Удаляет рецепты из избранного или списка покупок одним запросом."""
+    lock_user(user)
+    rows = dict(model.objects.select_for_update().filter(
+        author=user, recipe_id__in=recipe_ids).values_list('recipe_id', 'id'))
+    existing = set(rows)
+    if delete_rows(model, rows.values()) == len(rows):
+        change_counters(model, existing, -1)
+    else:
+        # Часть строк успел удалить другой запрос, и его сигналы уже
+        # уменьшили счётчики.
+        recount_counters(model, existing)
+    if existing and model is ShoppingCart:
+        invalidate_shopping_list(user.id)
+    return {
+        recipe_id: REMOVED if recipe_id in existing else NOT_FOUND
+        for recipe_id in recipe_ids
+    }
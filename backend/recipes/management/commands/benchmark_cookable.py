@@ -0,0 +1,61 @@
+import random
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+from recipes.cookable import COOKABLE_LIMIT, cookable_index
+from recipes.models import Recipe, RecipeIngredient
+
+
+def search_sql(ingredient_ids, max_missing):
+    """Тот же поиск через соединение с RecipeIngredient и HAVING."""
+    return list(Recipe.objects.annotate(
+        total=Count('recipe_ingredients'),
+        matched=Count('recipe_ingredients', filter=Q(
+            recipe_ingredients__ingredient__in=ingredient_ids)),
+    ).annotate(missing=F('total') - F('matched')).filter(
+        matched__gt=0, missing__lte=max_missing
+    ).order_by('missing', '-id').values_list(
+        'id', flat=True)[:COOKABLE_LIMIT])
+
+
+class Command(BaseCommand):
+    help = ('Сравнение поиска рецептов по имеющимся ингредиентам в БД '
+            'и в битовом индексе в памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--sizes', type=int, nargs='*',
+                            default=(5, 10, 20, 40),
+                            help='Сколько ингредиентов есть у пользователя')
+        parser.add_argument('--max-missing', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        popular = list(RecipeIngredient.objects.values(
+            'ingredient_id').annotate(uses=Count('id')).order_by(
+                '-uses').values_list('ingredient_id', flat=True)[:300])
+        if not popular:
+            raise CommandError('Нет рецептов: выполните generate_data')
+        max_missing = options['max_missing']
+        repeat = options['repeat']
+        build = timeit(cookable_index._build, number=1)
+        cookable_index.search(popular[:1], max_missing)
+        self.stdout.write(
+            f'Построение индекса: {build * 1000:.1f} мс\n'
+            f'{"ингредиентов":<14}{"БД, мс":>10}{"индекс, мс":>12}'
+            f'{"найдено":>10}{"совпадает":>11}')
+        for size in options['sizes']:
+            ingredient_ids = random.sample(popular, min(size, len(popular)))
+            database = timeit(lambda: search_sql(ingredient_ids, max_missing),
+                              number=repeat)
+            index = timeit(
+                lambda: cookable_index.search(ingredient_ids, max_missing),
+                number=repeat)
+            expected = search_sql(ingredient_ids, max_missing)
+            found = cookable_index.search(ingredient_ids, max_missing)
+            self.stdout.write(
+                f'{size:<14}{database / repeat * 1000:>10.2f}'
+                f'{index / repeat * 1000:>12.2f}{len(found):>10}'
+                f'{"да" if found == expected else "нет":>11}')
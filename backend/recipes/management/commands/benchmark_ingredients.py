@@ -0,0 +1,33 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+QUERIES = ('а', 'мо', 'мука', 'сах', 'к', 'перец', 'сыр', 'яй')
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска ингредиентов в БД и в индексе в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('queries', nargs='*', default=QUERIES)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        ingredient_index.search('')
+        self.stdout.write(f'{"запрос":<10}{"БД, мкс":>12}{"индекс, мкс":>14}')
+        for query in options['queries']:
+            database = timeit(
+                lambda: list(Ingredient.objects.filter(
+                    name__istartswith=query).values(
+                        'id', 'name', 'measurement_unit')),
+                number=repeat
+            )
+            index = timeit(lambda: ingredient_index.search(query),
+                           number=repeat)
+            self.stdout.write(
+                f'{query:<10}{database / repeat * 1e6:>12.1f}'
+                f'{index / repeat * 1e6:>14.1f}'
+            )
@@ -0,0 +1,72 @@
+import re
+
+from django.core.management.base import BaseCommand
+from recipes.feed import FEED_ORDERING, get_feed
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from users.models import User
+
+INDEX_USAGE = re.compile(
+    r'Index Scan|Index Only Scan|Bitmap Index Scan|USING (COVERING )?INDEX',
+    re.IGNORECASE
+)
+
+
+def get_hot_queries():
+    """Запросы, на которых держатся основные эндпоинты API."""
+    user = User.objects.order_by('id').first()
+    recipe = Recipe.objects.order_by('id').first()
+    tag = Tag.objects.order_by('id').first()
+    user_id = user.id if user else 0
+    recipe_id = recipe.id if recipe else 0
+    slug = tag.slug if tag else ''
+    queries = {
+        'Лента рецептов (-pub_date)': Recipe.objects.order_by(
+            '-pub_date', '-id')[:6],
+        'Рецепты автора': Recipe.objects.filter(
+            author_id=user_id).order_by('-pub_date')[:6],
+        'Популярные рецепты': Recipe.objects.order_by(
+            '-favorites_count', '-pub_date')[:6],
+        'Фильтр по тегу': Recipe.objects.filter(tags__slug=slug)[:6],
+        'Избранное пользователя': Recipe.objects.filter(
+            favorite__author_id=user_id)[:6],
+        'Список покупок пользователя': Recipe.objects.filter(
+            shopping_cart__author_id=user_id)[:6],
+        'Рецепт в избранном': Favorite.objects.filter(
+            author_id=user_id, recipe_id=recipe_id),
+        'Рецепт в списке покупок': ShoppingCart.objects.filter(
+            author_id=user_id, recipe_id=recipe_id),
+        'Добавившие рецепт в избранное': Favorite.objects.filter(
+            recipe_id=recipe_id),
+        'Подписка на автора': Follow.objects.filter(
+            user_id=user_id, author_id=user_id),
+        'Подписчики автора': Follow.objects.filter(author_id=user_id),
+        'Поиск ингредиента по подстроке': Ingredient.objects.filter(
+            name__icontains='сыр'),
+    }
+    if user:
+        # Пагинация ленты берёт из каждого источника страницу и ещё одну
+        # строку, чтобы узнать, есть ли следующая.
+        for number, source in enumerate(get_feed(user), 1):
+            queries[f'Лента подписок, источник {number}'] = source.order_by(
+                *FEED_ORDERING)[:7]
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN для основных запросов API с проверкой индексов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Выводить планы запросов целиком')
+
+    def handle(self, *args, **options):
+        for name, queryset in get_hot_queries().items():
+            plan = queryset.explain()
+            if INDEX_USAGE.search(plan):
+                verdict = self.style.SUCCESS('индекс используется')
+            else:
+                verdict = self.style.WARNING('индекс не используется')
+            self.stdout.write(f'{name}: {verdict}')
+            if options['verbose_plans']:
+                self.stdout.write(plan + '\n')
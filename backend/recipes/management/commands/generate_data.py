@@ -0,0 +1,190 @@
+import os
+import random
+from datetime import timedelta
+from itertools import accumulate
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from recipes.cache import bump_data_version
+from recipes.models import (Favorite, FeedItem, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from users.models import User
+
+BATCH_SIZE = 2000
+WORDS = ('Домашний', 'Быстрый', 'Сытный', 'Лёгкий', 'Острый', 'Летний',
+         'Зимний', 'Праздничный', 'Бабушкин', 'Пряный')
+DISHES = ('суп', 'салат', 'пирог', 'омлет', 'рагу', 'плов', 'гуляш',
+          'пудинг', 'соус', 'смузи')
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса степенного распределения: немногие объекты
+    очень популярны, большинство почти не встречается."""
+    return list(accumulate(
+        1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def pick_distinct(population, cum_weights, count, exclude=None):
+    chosen = set()
+    for item in random.choices(population, cum_weights=cum_weights,
+                               k=count * 2):
+        if len(chosen) == count:
+            break
+        if item != exclude:
+            chosen.add(item)
+    return chosen
+
+
+def random_count(average, limit):
+    """Число объектов из показательного распределения, 0 при average=0."""
+    if not average:
+        return 0
+    return min(limit, int(random.expovariate(1 / average)))
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических пользователей, рецептов, подписок, '
+            'избранного и списков покупок для нагрузочных тестов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Среднее число избранных рецептов')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Среднее число рецептов в списке покупок')
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='Показатель степенного распределения')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        for name in ('follows', 'favorites', 'cart'):
+            if options[name] < 0:
+                raise CommandError(
+                    f'--{name} не может быть отрицательным')
+        random.seed(options['seed'])
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < 30 or not tag_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги: manage.py importcsv')
+        images = [
+            f'dishes/{name}' for name in sorted(os.listdir(
+                os.path.join(settings.MEDIA_ROOT, 'dishes')))
+            if not os.path.isdir(
+                os.path.join(settings.MEDIA_ROOT, 'dishes', name))
+        ] or ['dishes/placeholder.png']
+        started = monotonic()
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users, options['recipes'], ingredient_ids, tag_ids, images)
+            self.create_follows(users, options['follows'],
+                                options['exponent'])
+            self.create_items(users, recipes, options)
+        bump_data_version(RecipeIngredient)
+        call_command('recount', stdout=self.stdout)
+        call_command('update_search_index', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {monotonic() - started:.1f} с.'))
+
+    def create_users(self, count):
+        password = make_password('password')
+        prefix = f'bench{random.randrange(10 ** 6)}'
+        User.objects.bulk_create((
+            User(email=f'{prefix}_{number}@example.com',
+                 username=f'{prefix}_{number}',
+                 first_name='Тест', last_name=f'Пользователь {number}',
+                 password=password)
+            for number in range(count)
+        ), batch_size=BATCH_SIZE)
+        self.users = User.objects.filter(username__startswith=f'{prefix}_')
+        users = list(self.users.values_list('id', flat=True))
+        self.stdout.write(f'Пользователей: {len(users)}')
+        return users
+
+    def create_recipes(self, users, count, ingredient_ids, tag_ids, images):
+        authors = random.choices(
+            users, cum_weights=zipf_weights(len(users), 1.0), k=count)
+        Recipe.objects.bulk_create((
+            Recipe(author_id=author_id,
+                   name=f'{random.choice(WORDS)} {random.choice(DISHES)} '
+                        f'№{number}',
+                   text='Синтетический рецепт для нагрузочного теста.',
+                   image=random.choice(images),
+                   cooking_time=random.randint(5, 180))
+            for number, author_id in enumerate(authors)
+        ), batch_size=BATCH_SIZE)
+        recipes = list(Recipe.objects.filter(
+            author__in=self.users).only('id', 'author_id', 'pub_date'))
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=random.randint(0, 60 * 24 * 365))
+        Recipe.objects.bulk_update(recipes, ('pub_date',),
+                                   batch_size=BATCH_SIZE)
+        RecipeIngredient.objects.bulk_create((
+            RecipeIngredient(recipe_id=recipe.id, ingredient_id=ingredient_id,
+                             amount=random.randint(1, 500))
+            for recipe in recipes
+            for ingredient_id in random.sample(ingredient_ids,
+                                               random.randint(5, 30))
+        ), batch_size=BATCH_SIZE)
+        max_tags = min(3, len(tag_ids))
+        Recipe.tags.through.objects.bulk_create((
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe in recipes
+            for tag_id in random.sample(tag_ids,
+                                        random.randint(1, max_tags))
+        ), batch_size=BATCH_SIZE)
+        self.recipes_by_author = {}
+        for recipe in sorted(recipes, key=lambda recipe: recipe.pub_date,
+                             reverse=True):
+            self.recipes_by_author.setdefault(
+                recipe.author_id, []).append(recipe)
+        self.stdout.write(f'Рецептов: {len(recipes)}')
+        return [recipe.id for recipe in recipes]
+
+    def create_follows(self, users, average, exponent):
+        weights = zipf_weights(len(users), exponent)
+        follows = [
+            (user_id, author_id)
+            for user_id in users
+            for author_id in pick_distinct(
+                users, weights,
+                random_count(average, len(users) - 1), exclude=user_id)
+        ]
+        Follow.objects.bulk_create(
+            (Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in follows),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        FeedItem.objects.bulk_create((
+            FeedItem(user_id=user_id, recipe_id=recipe.id,
+                     author_id=author_id, pub_date=recipe.pub_date)
+            for user_id, author_id in follows
+            for recipe in self.recipes_by_author.get(
+                author_id, [])[:settings.FEED_BACKFILL]
+        ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+        self.stdout.write(f'Подписок: {len(follows)}')
+
+    def create_items(self, users, recipes, options):
+        weights = zipf_weights(len(recipes), options['exponent'])
+        for model, average in ((Favorite, options['favorites']),
+                               (ShoppingCart, options['cart'])):
+            model.objects.bulk_create((
+                model(author_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in pick_distinct(
+                    recipes, weights, random_count(average, len(recipes)))
+            ), batch_size=BATCH_SIZE, ignore_conflicts=True)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: '
+                f'{model.objects.filter(author__in=self.users).count()}')
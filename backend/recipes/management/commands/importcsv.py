@@ -1,43 +1,120 @@
 import csv
+import json
 import os
+from itertools import islice
+from time import monotonic
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.cache import bump_data_version
 from recipes.models import Ingredient, Tag
 
+MODELS = {
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+    'tags': (Tag, ('name', 'color', 'slug')),
+}
+DEFAULT_FILES = ('ingredients.csv', 'tags.csv')
+CHUNK_SIZE = 64 * 1024
 
-def get_reader(file_name):
-    csv_path = os.path.join(settings.BASE_DIR, 'static/data/', file_name)
-    csv_file = open(csv_path, 'r', encoding='utf-8')
-    return csv.reader(csv_file, delimiter=',')
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_items(path, file):
+    if path.endswith('.jsonl'):
+        return (json.loads(line) for line in file if line.strip())
+    return iter_json_array(file)
+
+
+def read_rows(path, fields):
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.endswith(('.json', '.jsonl')):
+            for item in read_items(path, file):
+                yield {field: item[field] for field in fields}
+        else:
+            for row in csv.reader(file, delimiter=','):
+                yield dict(zip(fields, row))
+
+
+def get_batches(rows, size):
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_model_name(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name not in MODELS:
+        raise CommandError(
+            f'Не удалось определить модель для {path}, укажите --model')
+    return name
 
 
 class Command(BaseCommand):
-    help = 'Импорт ингредиентов из csv-файла'
+    help = ('Импорт ингредиентов и тегов из csv-, json- или jsonl-файлов; '
+            'файлы читаются потоково, пачками по --batch-size строк')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Файлы для импорта, по умолчанию static/data/*.csv')
+        parser.add_argument('--model', choices=MODELS)
+        parser.add_argument('--batch-size', type=int, default=1000)
 
     def handle(self, *args, **options):
-        csv_reader = get_reader('ingredients.csv')
-        try:
-            for row in csv_reader:
-                name, measurement_unit = row[0], row[1]
-                obj, created = Ingredient.objects.get_or_create(
-                    name=name, measurement_unit=measurement_unit)
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"Файл {csv_reader} не найден"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(str(e)))
-        else:
-            self.stdout.write(self.style.SUCCESS('Ингредиенты добавлены.'))
+        paths = options['paths'] or [
+            os.path.join(settings.BASE_DIR, 'static/data/', file_name)
+            for file_name in DEFAULT_FILES
+        ]
+        for path in paths:
+            model_name = options['model'] or get_model_name(path)
+            try:
+                self.import_file(path, model_name, options['batch_size'])
+                bump_data_version(MODELS[model_name][0])
+            except FileNotFoundError:
+                self.stdout.write(self.style.ERROR(f'Файл {path} не найден'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(str(e)))
 
-        csv_reader = get_reader('tags.csv')
-        try:
-            for row in csv_reader:
-                name, color, slug = row[0], row[1], row[2]
-                obj, created = Tag.objects.get_or_create(
-                    name=name, color=color, slug=slug)
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f"Файл {csv_reader} не найден"))
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(str(e)))
-        else:
-            self.stdout.write(self.style.SUCCESS('Теги добавлены.'))
+    def import_file(self, path, model_name, batch_size):
+        model, fields = MODELS[model_name]
+        started = monotonic()
+        rows = 0
+        existing = model.objects.count()
+        with transaction.atomic():
+            for batch in get_batches(read_rows(path, fields), batch_size):
+                model.objects.bulk_create(
+                    (model(**row) for row in batch),
+                    batch_size=batch_size,
+                    ignore_conflicts=True
+                )
+                rows += len(batch)
+        created = model.objects.count() - existing
+        elapsed = monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: обработано строк {rows}, добавлено {created}, '
+            f'{rows / elapsed if elapsed else rows:.0f} строк/с'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Обработка изображений рецептов, у которых нет уменьшенных '
+            'копий: задачи из очереди теряются при перезапуске, а '
+            'ошибки сохраняются в image_error')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Обработать заново все изображения')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        processed = failed = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            try:
+                process_recipe_image(recipe_id)
+            except Exception as error:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    f'Рецепт {recipe_id}: {error}'))
+            else:
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}, с ошибкой: {failed}.'))
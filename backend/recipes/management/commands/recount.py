@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Follow, Recipe, ShoppingCart
+from users.models import User
+
+
+def count_by(queryset, field):
+    """Подзапрос с числом строк queryset для внешнего объекта."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков рецептов, подписчиков, избранного и покупок'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = Recipe.objects.update(
+                favorites_count=count_by(Favorite.objects, 'recipe'),
+                shopping_cart_count=count_by(ShoppingCart.objects, 'recipe'),
+            )
+            users = User.objects.update(
+                recipes_count=count_by(Recipe.objects, 'author'),
+                followers_count=count_by(Follow.objects, 'author'),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users}.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from recipes.models import USE_POSTGRES, Recipe
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт поисковых векторов всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        if not USE_POSTGRES:
+            update_search_vectors()
+            self.stdout.write(self.style.SUCCESS(
+                'Индекс в памяти будет перестроен при следующем поиске.'))
+            return
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(recipe_ids.filter(
+                id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            updated += update_search_vectors(batch)
+            last_id = batch[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы обновлены у {updated} рецептов.'))
@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
+from django.utils import timezone
+from recipes.models import Favorite, Recipe, RecipeTrend, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт рейтинга рецептов по добавлениям в избранное '
+            'и в списки покупок с затуханием во времени')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life', type=float, default=72,
+                            help='Период полураспада рейтинга, в часах')
+        parser.add_argument('--favorite-weight', type=float, default=1.0)
+        parser.add_argument('--cart-weight', type=float, default=0.5)
+        parser.add_argument('--min-score', type=float, default=0.01,
+                            help='Рейтинги ниже порога удаляются')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Пересчитать рейтинг по всей истории')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        half_life = options['half_life'] * 60 * 60
+
+        def decay(moment):
+            return 0.5 ** ((now - moment).total_seconds() / half_life)
+
+        with transaction.atomic():
+            last_run = None
+            if not options['rebuild']:
+                last_run = RecipeTrend.objects.aggregate(
+                    last_run=Max('updated'))['last_run']
+            if last_run is None:
+                RecipeTrend.objects.all().delete()
+            else:
+                RecipeTrend.objects.update(
+                    score=F('score') * decay(last_run), updated=now)
+
+            scores = defaultdict(float)
+            for model, weight in ((Favorite, options['favorite_weight']),
+                                  (ShoppingCart, options['cart_weight'])):
+                events = model.objects.filter(created__lte=now)
+                if last_run is not None:
+                    events = events.filter(created__gt=last_run)
+                for recipe_id, created in events.values_list(
+                        'recipe_id', 'created').iterator():
+                    scores[recipe_id] += weight * decay(created)
+
+            trends = RecipeTrend.objects.in_bulk(list(scores))
+            for trend in trends.values():
+                trend.score += scores[trend.pk]
+            RecipeTrend.objects.bulk_update(
+                trends.values(), ('score',), batch_size=1000)
+            RecipeTrend.objects.bulk_create(
+                (RecipeTrend(recipe_id=recipe_id, score=score, updated=now)
+                 for recipe_id, score in scores.items()
+                 if recipe_id not in trends),
+                batch_size=1000
+            )
+            removed, _ = RecipeTrend.objects.filter(
+                score__lt=options['min_score']).delete()
+            # Копия рейтинга в рецепте нужна для сортировки по индексу
+            # без соединения с RecipeTrend.
+            Recipe.objects.filter(trend__isnull=False).update(
+                trending_score=Subquery(RecipeTrend.objects.filter(
+                    recipe=OuterRef('pk')).values('score')[:1]))
+            Recipe.objects.filter(trend__isnull=True).exclude(
+                trending_score=0).update(trending_score=0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг обновлён: событий у {len(scores)} рецептов, '
+            f'удалено устаревших {removed}.'))
@@ -1,8 +1,23 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef,
+                              Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
 from users.models import User
 
+USE_POSTGRES = 'postgresql' in settings.DATABASES['default']['ENGINE']
+# Поля рецепта, которые меняют сигналы, фоновые задачи и команды
+# отдельными UPDATE.
+RECIPE_MANAGED_FIELDS = ('favorites_count', 'shopping_cart_count',
+                         'trending_score', 'image_variants', 'image_error',
+                         'search_vector')
+
 
 class Tag(models.Model):
     """Модель тега."""
@@ -59,6 +74,54 @@ class Ingredient(models.Model):
                 name='unique_ingredient'
             ),
         )
+        indexes = (
+            GinIndex(fields=('name',), name='ingredient_name_trgm_idx',
+                     opclasses=('gin_trgm_ops',)),
+        ) if USE_POSTGRES else ()
+
+
+class RecipeQuerySet(models.QuerySet):
+    def annotate_user_flags(self, user):
+        """Помечает рецепты флагами избранного и списка покупок."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                author=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                author=user, recipe=OuterRef('pk'))),
+        )
+
+    def in_order(self, recipe_ids, rank):
+        """Рецепты из списка id, упорядоченные как в списке.
+
+        Место в списке попадает в аннотацию rank: у первого рецепта
+        она наибольшая.
+        """
+        return self.filter(pk__in=recipe_ids).annotate(**{rank: Case(
+            *(When(pk=recipe_id, then=Value(len(recipe_ids) - position))
+              for position, recipe_id in enumerate(recipe_ids)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )}).order_by(f'-{rank}')
+
+    def newest_per_author(self, limit):
+        """Оставляет не больше limit последних рецептов каждого автора."""
+        ranked = self.order_by().annotate(position=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=F('pub_date').desc(),
+        )).values('pk', 'position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) AS ranked '
+            f'WHERE ranked.position <= %s',
+            (*params, limit)
+        ))
 
 
 class Recipe(models.Model):
@@ -82,6 +145,18 @@ class Recipe(models.Model):
         upload_to='dishes/',
         verbose_name='Изображение блюда'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
+    image_error = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Ошибка обработки изображения'
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название',
@@ -97,10 +172,46 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Полное сохранение объекта, загруженного до этих UPDATE, не должно
+        # перезаписывать их результат устаревшими значениями.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in RECIPE_MANAGED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
         default_related_name = 'recipe'
@@ -112,6 +223,21 @@ class Recipe(models.Model):
                 name='unique_recipe'
             ),
         )
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=('-favorites_count', '-pub_date', '-id'),
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=('-trending_score', '-pub_date', '-id'),
+                         name='recipe_trending_score_idx'),
+            models.Index(fields=('cooking_time', '-pub_date', '-id'),
+                         name='recipe_cooking_time_idx'),
+        ) + ((
+            GinIndex(fields=('search_vector',),
+                     name='recipe_search_vector_idx'),
+        ) if USE_POSTGRES else ())
 
 
 class RecipeIngredient(models.Model):
@@ -157,12 +283,21 @@ class BaseItem(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     def __str__(self):
         return f'{self.recipe}'
 
     class Meta:
         abstract = True
+        indexes = (
+            models.Index(fields=('recipe', 'author'),
+                         name='%(class)s_recipe_author_idx'),
+        )
 
 
 class ShoppingCart(BaseItem):
@@ -195,6 +330,32 @@ class Favorite(BaseItem):
         )
 
 
+class RecipeTrend(models.Model):
+    """Модель рейтинга рецепта по недавней активности пользователей."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trend',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        default=0,
+        db_index=True,
+        verbose_name='Рейтинг'
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата пересчёта'
+    )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score:.2f}'
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+
 class Follow(models.Model):
     """Модель подписки на аторов рецептов."""
     user = models.ForeignKey(
@@ -226,3 +387,74 @@ class Follow(models.Model):
                 name='no_self_following'
             )
         )
+        indexes = (
+            models.Index(fields=('author', 'user'),
+                         name='follow_author_user_idx'),
+        )
+
+
+class FeedItem(models.Model):
+    """Модель ленты: рецепт автора, на которого подписан пользователь."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            ),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date'),
+                         name='feed_user_pub_date_idx',
+                         include=('recipe',) if USE_POSTGRES else ()),
+        )
+
+
+class DataVersion(models.Model):
+    """Версия данных модели для сброса кешей и индексов в памяти.
+
+    Хранится в БД, чтобы изменения из management-команд и других
+    процессов доходили до всех воркеров.
+    """
+    label = models.CharField(
+        max_length=100,
+        primary_key=True,
+        verbose_name='Модель'
+    )
+    version = models.BigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+
+    def __str__(self):
+        return f'{self.label}: {self.version}'
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
@@ -0,0 +1,189 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from operator import itemgetter
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from .cache import bump_data_version, get_data_version
+from .models import USE_POSTGRES, Ingredient, Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+SEARCH_LIMIT = 1000
+TOKEN_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+STEM_LENGTH = 5
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold().replace('ё', 'е'))
+
+
+class VersionedIndex:
+    """Индекс в памяти процесса поверх данных модели.
+
+    Строится при первом обращении и перестраивается, когда меняется
+    версия данных модели.
+    """
+    model = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _load(self):
+        version = get_data_version(self.model)
+        if self._version == version:
+            return self._data
+        with self._lock:
+            if self._version != version:
+                self._data = self._build()
+                self._version = version
+            return self._data
+
+    def invalidate(self):
+        self._version = None
+
+
+class IngredientIndex(VersionedIndex):
+    """Индекс названий ингредиентов.
+
+    Сначала отдаёт совпадения по началу названия, затем по вхождению
+    подстроки.
+    """
+    model = Ingredient
+
+    def _build(self):
+        ingredients = Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).order_by('name', 'measurement_unit')
+        entries = sorted((
+            (name.casefold(), {'id': pk, 'name': name,
+                               'measurement_unit': measurement_unit})
+            for pk, name, measurement_unit in ingredients
+        ), key=itemgetter(0))
+        keys = [key for key, _ in entries]
+        return keys, [ingredient for _, ingredient in entries]
+
+    def search(self, query):
+        keys, ingredients = self._load()
+        query = query.strip().casefold()
+        if not query:
+            return list(ingredients)
+        start = end = bisect.bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        return ingredients[start:end] + [
+            ingredient for key, ingredient in zip(keys, ingredients)
+            if query in key and not key.startswith(query)
+        ]
+
+
+class RecipeIndex(VersionedIndex):
+    """Инвертированный индекс рецептов для баз без полнотекстового поиска.
+
+    Слово запроса совпадает с любым словом рецепта, которое с него
+    начинается; у длинных слов последняя буква отбрасывается, чтобы
+    находились другие падежные формы. Вес совпадения в названии выше,
+    чем в ингредиентах, а в ингредиентах выше, чем в описании.
+    """
+    model = Recipe
+    weights = {'name': 3, 'ingredients': 2, 'text': 1}
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(int))
+
+        def add(recipe_id, text, weight):
+            for token in tokenize(text):
+                postings[token][recipe_id] += weight
+
+        for recipe_id, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text').iterator():
+            add(recipe_id, name, self.weights['name'])
+            add(recipe_id, text, self.weights['text'])
+        for recipe_id, name in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient__name').iterator():
+            add(recipe_id, name, self.weights['ingredients'])
+        return sorted(postings), postings
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """id подходящих под все слова запроса рецептов по убыванию веса."""
+        tokens, postings = self._load()
+        scores = None
+        for term in set(tokenize(query)):
+            if len(term) < MIN_TERM_LENGTH:
+                continue
+            if len(term) >= STEM_LENGTH:
+                term = term[:-1]
+            matched = defaultdict(int)
+            position = bisect.bisect_left(tokens, term)
+            while (position < len(tokens)
+                   and tokens[position].startswith(term)):
+                for recipe_id, score in postings[tokens[position]].items():
+                    matched[recipe_id] += score
+                position += 1
+            if scores is not None:
+                matched = {recipe_id: score + matched[recipe_id]
+                           for recipe_id, score in scores.items()
+                           if recipe_id in matched}
+            scores = matched
+            if not scores:
+                break
+        ranked = sorted((scores or {}).items(),
+                        key=lambda item: (-item[1], -item[0]))
+        return [recipe_id for recipe_id, _ in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
+recipe_index = RecipeIndex()
+
+
+def get_search_vector():
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(ingredient_names, weight='B',
+                           config=SEARCH_CONFIG)
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(recipe_ids=None):
+    """Обновляет поисковые данные рецептов после изменения.
+
+    В PostgreSQL пересчитывает столбец search_vector, иначе после
+    фиксации транзакции сбрасывает индекс в памяти.
+    """
+    if not USE_POSTGRES:
+        transaction.on_commit(lambda: bump_data_version(Recipe))
+        return 0
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    return recipes.update(search_vector=get_search_vector())
+
+
+def search_recipes(queryset, query):
+    """Рецепты по запросу с рангом search_rank в порядке релевантности."""
+    if USE_POSTGRES:
+        query = SearchQuery(query, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    return queryset.in_order(
+        recipe_index.search(query), 'search_rank'
+    ).order_by('-search_rank', '-pub_date', '-id')
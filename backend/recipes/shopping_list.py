@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .cache import get_data_version
+from .models import Ingredient, RecipeIngredient
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Единица измерения из data/ingredients.csv -> (основная единица, множитель).
+# Штуки, пучки, щепотки и прочее «по вкусу» не переводятся.
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 250),
+}
+
+
+def consolidate(rows):
+    """Сводит количества одного ингредиента в разных единицах.
+
+    Строки с единицами одной величины складываются в основной единице.
+    Если ингредиент встречается только в одной единице, она сохраняется.
+    """
+    groups = {}
+    for name, unit, amount in rows:
+        canonical, _ = UNITS.get(unit, (unit, 1))
+        group = groups.setdefault((name, canonical), {})
+        group[unit] = group.get(unit, 0) + amount
+    items = []
+    for (name, canonical), amounts in groups.items():
+        if len(amounts) == 1:
+            unit, amount = next(iter(amounts.items()))
+        else:
+            unit = canonical
+            amount = sum(value * UNITS[source][1]
+                         for source, value in amounts.items())
+        items.append({'name': name, 'measurement_unit': unit,
+                      'amount': amount})
+    return sorted(items, key=lambda item: (item['name'],
+                                           item['measurement_unit']))
+
+
+def get_cache_key(user_id):
+    return f'shopping_list:{user_id}'
+
+
+def get_shopping_list(user):
+    """Сводный список покупок пользователя.
+
+    Хранится в кеше до изменения списка покупок пользователя, состава
+    рецептов или справочника ингредиентов.
+    """
+    key = get_cache_key(user.id)
+    versions = (get_data_version(RecipeIngredient),
+                get_data_version(Ingredient))
+    cached = cache.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    items = consolidate(RecipeIngredient.objects.filter(
+        recipe__shopping_cart__author=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amounts=Sum('amount')
+    ).order_by())
+    cache.set(key, (versions, items), CACHE_TIMEOUT)
+    return items
+
+
+def invalidate_shopping_list(user_id):
+    transaction.on_commit(lambda: cache.delete(get_cache_key(user_id)))
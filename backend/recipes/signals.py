@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_migrate
+from django.dispatch import receiver
+
+from users.models import User
+from .cache import bump_data_version
+from .cookable import update_cookable_index
+from .feed import backfill_feed, backfill_followers, fan_out_recipe
+from .models import (FeedItem, Favorite, Follow, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, Tag)
+from .shopping_list import invalidate_shopping_list
+from .tasks import enqueue
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик, не опуская его ниже нуля."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(pre_migrate)
+def create_trigram_extension(app_config, using, **kwargs):
+    """Расширение pg_trgm нужно для триграммного индекса ингредиентов."""
+    connection = connections[using]
+    if app_config.name == 'recipes' and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(**kwargs):
+    bump_data_version(Ingredient)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(**kwargs):
+    bump_data_version(RecipeIngredient)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(**kwargs):
+    bump_data_version(Tag)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        enqueue(fan_out_recipe, instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+    update_cookable_index([instance.id])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        enqueue(backfill_feed, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(instance, **kwargs):
+    with transaction.atomic():
+        followers_count = User.objects.select_for_update().filter(
+            pk=instance.author_id
+        ).values_list('followers_count', flat=True).first()
+        change_counter(User, instance.author_id, 'followers_count', -1)
+    FeedItem.objects.filter(
+        user_id=instance.user_id, author_id=instance.author_id).delete()
+    # Автор опустился до порога: его рецепты пора разложить по лентам.
+    if followers_count == settings.FEED_FANOUT_LIMIT + 1:
+        enqueue(backfill_followers, instance.author_id)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', 1)
+        invalidate_shopping_list(instance.author_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'shopping_cart_count', -1)
+    invalidate_shopping_list(instance.author_id)
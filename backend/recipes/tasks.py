@@ -0,0 +1,52 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def run_task(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s', func.__name__)
+    finally:
+        close_old_connections()
+
+
+class SyncBackend:
+    """Выполняет задачу сразу, в текущем потоке (для тестов)."""
+
+    def submit(self, func, *args):
+        func(*args)
+
+
+class ThreadPoolBackend:
+    """Очередь задач на пуле потоков внутри процесса."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.TASKS_WORKERS,
+            thread_name_prefix='tasks'
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(run_task, func, *args)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.TASKS_BACKEND)()
+    return _backend
+
+
+def enqueue(func, *args):
+    """Ставит задачу в очередь после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: get_backend().submit(func, *args))
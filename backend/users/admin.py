@@ -5,7 +5,7 @@ from .models import User
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('id', 'first_name', 'last_name', 'username', 'email',
-                    'role')
+                    'role', 'recipes_count', 'followers_count')
     search_fields = ('username', 'email')
     list_filter = ('username', 'email',)
 
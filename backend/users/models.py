@@ -3,6 +3,8 @@ from enum import Enum
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+COUNTER_FIELDS = ('recipes_count', 'followers_count')
+
 
 class UserRole(Enum):
     USER = 'Пользователь'
@@ -19,6 +21,16 @@ class User(AbstractUser):
         max_length=20,
         choices=[(role.value, role.name) for role in UserRole],
         default=UserRole.USER.value)
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username', 'password']
@@ -31,6 +43,17 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Счётчики меняются только через F() в сигналах, поэтому полное
+        # сохранение устаревшего объекта (например, из кеша токенов)
+        # не должно их перезаписывать.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def is_admin(self):
         return self.role == UserRole.ADMIN or self.is_superuser